@@ -1,3 +1,4 @@
+import functools
 import json
 import os
 
@@ -6,10 +7,13 @@ class ConfigLoader:
     """Loads configuration from config.dev.json or config.public.json."""
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def load_config():
         """
         Load configuration, preferring config.dev.json over config.public.json.
         Paths are relative to the script directory.
+        The file is read once per process; later calls return the same dict
+        (call load_config.cache_clear() to force a reload).
 
         Returns:
             dict: Configuration dictionary
@@ -1,5 +1,15 @@
+import binascii
+import collections
+import functools
+import io
 import json
+import threading
 import cbor2
+from JsonCodec import dumps, loads
+
+
+# Per-field wire key and scaling factor
+FieldInfo = collections.namedtuple("FieldInfo", "key scale")
 
 
 class DataOptimizer:
@@ -7,46 +17,144 @@ class DataOptimizer:
     Optimizes JSON data for transmission by minimizing keys and values.
     Supports both JSON and CBOR2 encoding formats.
     """
+
+    __slots__ = ("array_layout", "_enc_buf", "_encoder", "_decoder", "_lock", "_fast_encode")
     
-    # Combined field configuration with mapping and scaling
+    # Combined field configuration with mapping and scaling.
+    # Numbers are sent as round(value * scale) (fixed point, nearest rather than truncated),
+    # so the scale sets the transmitted precision.
+    # CBOR ints take 1/2/3/5 bytes below 24/256/65536/2^32, so a coarser scale only
+    # saves airtime when it moves values below one of those boundaries:
+    #   latitude/longitude 1e5 (~1 m): 1e4 (~11 m) would still need 5 bytes outside +-6.5 deg
+    #   heading 1e2 (0.01 deg): 0-360 deg fits in 3 bytes instead of 5
     FIELD_CONFIG = {
-        "type": {"key": 0, "scale": 1},
-        "station": {"key": 1, "scale": 1},
-        "callsign": {"key": 2, "scale": 1},
-        "latitude": {"key": 3, "scale": 1e5},
-        "longitude": {"key": 4, "scale": 1e5},
-        "altitude": {"key": 5, "scale": 1},
-        "speed": {"key": 6, "scale": 1e2},
-        "heading": {"key": 7, "scale": 1e5},
-        "time": {"key": 8, "scale": 1},
-        "comment": {"key": 9, "scale": 1},
-        "model": {"key": 10, "scale": 1},
-        "freq": {"key": 11, "scale": 1e3},
-        "temp": {"key": 12, "scale": 10},
-        "frame": {"key": 13, "scale": 1},
-        "humidity": {"key": 14, "scale": 10},
-        "pressure": {"key": 15, "scale": 10},
-        "sats": {"key": 16, "scale": 1},
-        "batt": {"key": 17, "scale": 10},
-        "sdr_device_idx": {"key": 18, "scale": 1},
-        "vel_v": {"key": 19, "scale": 10},
-        "vel_h": {"key": 20, "scale": 10},
-        "bt": {"key": 21, "scale": 1},
-        "snr": {"key": 22, "scale": 10},
-        "subtype": {"key": 23, "scale": 1},
-        "manufacturer": {"key": 24, "scale": 1}        
+        "type": FieldInfo(key=0, scale=1),
+        "station": FieldInfo(key=1, scale=1),
+        "callsign": FieldInfo(key=2, scale=1),
+        "latitude": FieldInfo(key=3, scale=1e5),
+        "longitude": FieldInfo(key=4, scale=1e5),
+        "altitude": FieldInfo(key=5, scale=1),
+        "speed": FieldInfo(key=6, scale=1e2),
+        "heading": FieldInfo(key=7, scale=1e2),
+        "time": FieldInfo(key=8, scale=1),
+        "comment": FieldInfo(key=9, scale=1),
+        "model": FieldInfo(key=10, scale=1),
+        "freq": FieldInfo(key=11, scale=1e3),
+        "temp": FieldInfo(key=12, scale=10),
+        "frame": FieldInfo(key=13, scale=1),
+        "humidity": FieldInfo(key=14, scale=10),
+        "pressure": FieldInfo(key=15, scale=10),
+        "sats": FieldInfo(key=16, scale=1),
+        "batt": FieldInfo(key=17, scale=10),
+        "sdr_device_idx": FieldInfo(key=18, scale=1),
+        "vel_v": FieldInfo(key=19, scale=10),
+        "vel_h": FieldInfo(key=20, scale=10),
+        "bt": FieldInfo(key=21, scale=1),
+        "snr": FieldInfo(key=22, scale=10),
+        "subtype": FieldInfo(key=23, scale=1),
+        "manufacturer": FieldInfo(key=24, scale=1)
     }
     
     # Reverse mapping: key -> field_name
-    REVERSE_KEY_MAPPING = {config["key"]: name for name, config in FIELD_CONFIG.items()}
+    REVERSE_KEY_MAPPING = {config.key: name for name, config in FIELD_CONFIG.items()}
+
+    # Precomputed decode table: key -> (field_name, scale)
+    _DECODE_TABLE = {config.key: (name, config.scale) for name, config in FIELD_CONFIG.items()}
+
+    # Flattened lookups: field_name -> key, field_name -> scale
+    _KEYS = {name: config.key for name, config in FIELD_CONFIG.items()}
+    _SCALES = {name: config.scale for name, config in FIELD_CONFIG.items()}
+
+    # Canonical field order for the array layout (position == key)
+    FIELD_ORDER = [name for name, _ in sorted(FIELD_CONFIG.items(), key=lambda item: item[1].key)]
+    # Positional decode table for the array layout: index -> (field_name, scale)
+    _ARRAY_DECODE_TABLE = tuple(entry for _, entry in sorted(_DECODE_TABLE.items()))
+    
+    def __init__(self, array_layout=False):
+        """
+        Initialize the data optimizer.
+
+        Args:
+            array_layout (bool): Encode CBOR as a fixed-order array instead of a map.
+                                 Decoding accepts both layouts.
+        """
+        self.array_layout = array_layout
+        # Reusable CBOR encoder/decoder (avoids per-packet setup)
+        self._enc_buf = io.BytesIO()
+        self._encoder = cbor2.CBOREncoder(self._enc_buf)
+        self._decoder = cbor2.CBORDecoder(io.BytesIO())
+        # Encoder/decoder state is shared, so serialize access
+        self._lock = threading.Lock()
+        # Schema-specialized encode function
+        self._fast_encode = self._compile_encoder()
+
+    @classmethod
+    @functools.cache
+    def _compile_encoder(cls):
+        """
+        Generate a straight-line encode function for the known schema.
+        Each FIELD_CONFIG entry gets its key and scale inlined as literals,
+        unknown keys fall back to the generic minimize helper.
+
+        Returns:
+            function: encode(data, minimize) -> optimized dict.
+        """
+        missing = object()
+
+        enc = ["def _fast_encode(data, _minimize, _missing=_missing):",
+               "    get = data.get",
+               "    optimized = {}",
+               "    found = 0"]
+        for name, config in cls.FIELD_CONFIG.items():
+            key, scale = config
+            enc += [f"    value = get({name!r}, _missing)",
+                    "    if value is not _missing:",
+                    "        found += 1",
+                    "        value_type = type(value)"]
+            if scale == 1:
+                enc += ["        if value_type is str or value_type is int:",
+                        f"            optimized[{key!r}] = value"]
+            else:
+                enc += ["        if value_type is float or value_type is int:",
+                        f"            optimized[{key!r}] = round(value * {scale!r})",
+                        "        elif value_type is str:",
+                        f"            optimized[{key!r}] = value"]
+            enc += ["        else:",
+                    f"            optimized[{key!r}] = _minimize(value, {name!r})"]
+        enc += ["    if found != len(data):",
+                "        for key, value in data.items():",
+                "            if key not in _known:",
+                "                optimized[key] = _minimize(value, key)",
+                "    return optimized"]
+
+        namespace = {
+            "_missing": missing,
+            "_known": frozenset(cls.FIELD_CONFIG),
+        }
+        source = "\n".join(enc) + "\n"
+        exec(compile(source, f"<{cls.__name__} encoder>", "exec"), namespace)
+        return namespace["_fast_encode"]
     
-    def __init__(self):
-        """Initialize the data optimizer."""
-        pass
+    def optimize_flat(self, data):
+        """
+        Optimize a flat packet dict (scalar values, as sent by the bridge) by minimizing keys.
+        Uses the schema-specialized encoder, the same path as to_cbor2/to_json_string.
+        
+        Args:
+            data (dict or str): Flat packet data to optimize. Can be dict or JSON string.
+            
+        Returns:
+            dict: Optimized data with shortened keys.
+        """
+        if isinstance(data, str):
+            data = loads(data)
+        return self._fast_encode(data, self._minimize_value)
     
     def optimize_json(self, data):
         """
         Optimize JSON data by minimizing keys.
+        General entry point: accepts JSON strings and nested lists/dicts.
+        For flat packet dicts prefer optimize_flat.
         
         Args:
             data (dict or str): JSON data to optimize. Can be dict or JSON string.
@@ -56,54 +164,182 @@ class DataOptimizer:
         """
         # Parse if string
         if isinstance(data, str):
-            data = json.loads(data)
+            data = loads(data)
         
+        field_config = self.FIELD_CONFIG
+        minimize = self._minimize_value
         optimized = {}
         for key, value in data.items():
-            short_key = self.FIELD_CONFIG[key]["key"] if key in self.FIELD_CONFIG else key
-            optimized[short_key] = self._minimize_value(value, key)
+            short_key, scale = field_config.get(key, (key, 1))
+            value_type = type(value)
+            if value_type is str:
+                optimized[short_key] = value
+            elif value_type is float or value_type is int:
+                optimized[short_key] = round(value * scale)
+            else:
+                # bool, None and nested values take the generic path
+                optimized[short_key] = minimize(value, key)
         
         return optimized
     
+    def encode_batch(self, packets):
+        """
+        Optimize a batch of packets, e.g. when re-encoding a packets_YYYY-MM-DD.jsonl log.
+        
+        Args:
+            packets (list): Packet dicts or JSON strings (e.g. log lines) to optimize.
+            
+        Returns:
+            list: Optimized dicts with shortened keys, in input order.
+        """
+        encode = self._fast_encode
+        minimize = self._minimize_value
+        return [encode(loads(packet) if isinstance(packet, str) else packet, minimize)
+                for packet in packets]
+    
     def to_json_string(self, data):
         """
         Convert optimized data to compact JSON string.
         
         Args:
-            data (dict): Data to convert.
+            data (dict or str): Data to convert. Can be dict or JSON string.
             
         Returns:
             str: Compact JSON string without whitespace.
         """
-        optimized = self.optimize_json(data)
-        return json.dumps(optimized, separators=(',', ':'), ensure_ascii=False)
+        if isinstance(data, str):
+            data = loads(data)
+        return self.optimized_to_json_string(self._fast_encode(data, self._minimize_value))
+
+    def optimized_to_json_string(self, optimized):
+        """
+        Convert already optimized data (see optimize_flat) to compact JSON string.
+        Lets callers that need both JSON and CBOR2 optimize the packet only once.
+
+        Args:
+            optimized (dict): Optimized data with shortened keys.
+
+        Returns:
+            str: Compact JSON string without whitespace.
+        """
+        return dumps(optimized)
     
     def to_cbor2(self, data):
         """
         Convert optimized data to CBOR2 binary format.
         
         Args:
-            data (dict): Data to convert.
+            data (dict or str): Data to convert. Can be dict or JSON string.
             
         Returns:
             bytes: CBOR2 encoded data.
         """
-        optimized = self.optimize_json(data)
-        return cbor2.dumps(optimized)
+        if isinstance(data, str):
+            data = loads(data)
+        return self.optimized_to_cbor2(self._fast_encode(data, self._minimize_value))
+
+    def optimized_to_cbor2(self, optimized):
+        """
+        Convert already optimized data (see optimize_flat) to CBOR2 binary format.
+        Lets callers that need both JSON and CBOR2 optimize the packet only once.
+
+        Args:
+            optimized (dict): Optimized data with shortened keys.
+
+        Returns:
+            bytes: CBOR2 encoded data.
+        """
+        if self.array_layout:
+            return self._encode_cbor(self._to_array(optimized))
+        return self._encode_cbor(optimized)
+
+    def to_cbor2_array(self, data):
+        """
+        Convert optimized data to CBOR2 as a fixed-order array (see FIELD_ORDER).
+        Drops all key bytes from the payload. Absent fields are sent as null,
+        trailing absent fields are omitted and fields outside FIELD_CONFIG are dropped.
+
+        Args:
+            data (dict or str): Data to convert. Can be dict or JSON string.
+
+        Returns:
+            bytes: CBOR2 encoded data.
+        """
+        if isinstance(data, str):
+            data = loads(data)
+        optimized = self._fast_encode(data, self._minimize_value)
+        return self._encode_cbor(self._to_array(optimized))
+
+    def _to_array(self, optimized):
+        """Lay out optimized data as a fixed-order value list."""
+        values = [optimized.get(key) for key in range(len(self.FIELD_ORDER))]
+        while values and values[-1] is None:
+            values.pop()
+        return values
     
     def from_cbor2(self, cbor_bytes):
         """
         Deserialize CBOR2 binary data back to JSON with full field names.
+        Accepts both the map and the array layout.
         
         Args:
             cbor_bytes (bytes): CBOR2 encoded data (from HEX).
             
         Returns:
             dict: Decoded data with full field names restored.
-        """
 
-        optimized = cbor2.loads(cbor_bytes)
+        Raises:
+            ValueError: If the data is not valid CBOR (cbor2.CBORDecodeError)
+                        or does not hold a map or array.
+        """
+        optimized = self._decode_cbor(cbor_bytes)
+        if isinstance(optimized, list):
+            return self._decode_array(optimized)
+        if not isinstance(optimized, dict):
+            raise ValueError(f"CBOR payload is not a packet: {type(optimized).__name__}")
         return self.decode_json(optimized)
+
+    def from_cbor2_array(self, cbor_bytes):
+        """
+        Deserialize CBOR2 array layout data back to JSON with full field names.
+
+        Args:
+            cbor_bytes (bytes): CBOR2 encoded array (see to_cbor2_array).
+
+        Returns:
+            dict: Decoded data with full field names restored.
+        """
+        return self._decode_array(self._decode_cbor(cbor_bytes))
+
+    def _decode_array(self, values):
+        """Restore a fixed-order value list into a dict with full field names."""
+        restore = self._restore_value
+        decoded = {}
+        # zip() stops at the shorter side: trimmed trailing fields and any
+        # positions beyond this schema (newer sender) are skipped
+        for (full_key, scale), value in zip(self._ARRAY_DECODE_TABLE, values):
+            if value is None:
+                continue
+            if type(value) is int:
+                decoded[full_key] = value / scale if scale != 1 else value
+            else:
+                decoded[full_key] = restore(value, full_key)
+        return decoded
+
+    def _encode_cbor(self, obj):
+        """Encode an object with the shared CBOR encoder."""
+        with self._lock:
+            buf = self._enc_buf
+            buf.seek(0)
+            buf.truncate()
+            self._encoder.encode(obj)
+            return buf.getvalue()
+
+    def _decode_cbor(self, cbor_bytes):
+        """Decode bytes with the shared CBOR decoder."""
+        with self._lock:
+            self._decoder.fp = io.BytesIO(cbor_bytes)
+            return self._decoder.decode()
     
     def _minimize_value(self, value, field_name=None):
         """
@@ -116,26 +352,33 @@ class DataOptimizer:
         Returns:
             Minimized value.
         """
-        if isinstance(value, bool):
+        # Exact type checks first: a pointer compare each, and bool never
+        # matches int here so the common float/int case needs no bool guard
+        value_type = type(value)
+        if value_type is float or value_type is int:
+            return round(value * self._SCALES.get(field_name, 1))
+        elif value_type is str:
+            return value
+        elif value_type is bool:
             # Convert booleans to 0/1
             return 1 if value else 0
-        elif isinstance(value, str):
+
+        # Subclasses and containers (bool cannot be subclassed)
+        if isinstance(value, str):
             # Keep strings as-is
             return value
         elif isinstance(value, (int, float)):
-            # Apply field-specific scaling factor
-            if field_name and field_name in self.FIELD_CONFIG:
-                scale = self.FIELD_CONFIG[field_name]["scale"]
-            else:
-                scale = 1  # No scaling for fields not in FIELD_CONFIG
-            return int(value * scale)
+            # Apply field-specific scaling factor (no scaling for fields not in FIELD_CONFIG)
+            return round(value * self._SCALES.get(field_name, 1))
         elif isinstance(value, list):
             # Minimize list values
-            return [self._minimize_value(v, field_name) for v in value]
+            minimize = self._minimize_value
+            return [minimize(v, field_name) for v in value]
         elif isinstance(value, dict):
             # Recursively minimize nested dicts
-            return {self.FIELD_CONFIG[k]["key"] if k in self.FIELD_CONFIG else k: self._minimize_value(v, k) 
-                    for k, v in value.items()}
+            keys = self._KEYS
+            minimize = self._minimize_value
+            return {keys.get(k, k): minimize(v, k) for k, v in value.items()}
         return value
     
     def decode_json(self, optimized_data):
@@ -148,10 +391,19 @@ class DataOptimizer:
         Returns:
             dict: Data with full field names restored.
         """
+        decode_table = self._DECODE_TABLE
+        restore = self._restore_value
         decoded = {}
         for short_key, value in optimized_data.items():
-            full_key = self.REVERSE_KEY_MAPPING.get(short_key, short_key)
-            decoded[full_key] = self._restore_value(value, full_key)
+            entry = decode_table.get(short_key)
+            if entry is None:
+                decoded[short_key] = restore(value, short_key)
+                continue
+            full_key, scale = entry
+            if type(value) is int:
+                decoded[full_key] = value / scale if scale != 1 else value
+            else:
+                decoded[full_key] = restore(value, full_key)
         return decoded
     
     def _restore_value(self, value, field_name=None):
@@ -167,23 +419,31 @@ class DataOptimizer:
         """
         if isinstance(value, int):
             # Restore using field-specific scaling factor
-            if field_name and field_name in self.FIELD_CONFIG:
-                scale = self.FIELD_CONFIG[field_name]["scale"]
-                val = value / scale if scale != 0 else value
-                return val if scale != 1 else int(val)
-            else:
-                return value  # No scaling to remove
+            scale = self._SCALES.get(field_name, 1)
+            if scale == 1 or scale == 0:
+                return value  # Nothing to unscale, skip the division
+            # Divide rather than multiply by 1/scale: the reciprocal is inexact and
+            # changes the last digit of ~13-52% of values (e.g. -51 * 0.1 != -5.1)
+            return value / scale
         elif isinstance(value, list):
-            return [self._restore_value(v, field_name) for v in value]
+            restore = self._restore_value
+            return [restore(v, field_name) for v in value]
         elif isinstance(value, dict):
-            return {self.REVERSE_KEY_MAPPING.get(k, k): self._restore_value(v, self.REVERSE_KEY_MAPPING.get(k, k)) 
-                    for k, v in value.items()}
+            reverse = self.REVERSE_KEY_MAPPING
+            restore = self._restore_value
+            decoded = {}
+            for k, v in value.items():
+                full_key = reverse.get(k, k)
+                decoded[full_key] = restore(v, full_key)
+            return decoded
         return value
 
 
+# Shared instance: tables and the generated encoder are built once at import
+optimizer = DataOptimizer()
+
+
 if __name__ == "__main__":
-    optimizer = DataOptimizer()
-    
     real_packet = {
     "type": "PAYLOAD_SUMMARY", 
     "station": "4Z1KD", 
@@ -209,9 +469,12 @@ if __name__ == "__main__":
     }
     
     
+    # Optimize once, then encode to JSON and/or CBOR2
+    optimized = optimizer.optimize_flat(real_packet)
+
     # Optimize to JSON
     '''
-    optimized_json = optimizer.to_json_string(real_packet)
+    optimized_json = optimizer.optimized_to_json_string(optimized)
     print(f"Original size: {len(json.dumps(real_packet))} bytes")
     print(f"Optimized JSON: {optimized_json}")
     print(f"Optimized JSON size: {len(optimized_json)} bytes")
@@ -219,15 +482,13 @@ if __name__ == "__main__":
     '''
     
     # Optimize to CBOR2
-    cbor_data = optimizer.to_cbor2(real_packet)
+    cbor_data = optimizer.optimized_to_cbor2(optimized)
     print(f"CBOR2 size: {len(cbor_data)} bytes")
-    cbor_hex = cbor_data.hex()
-    print(f"CBOR2 (hex): {cbor_hex}")
+    print(f"CBOR2 (hex): {binascii.hexlify(cbor_data).decode('ascii')}")
 
 
     # CBOR2 back to JSON
-    cbor_bytes = bytes.fromhex(cbor_hex)
-    decoded_data = optimizer.from_cbor2(cbor_bytes)
+    decoded_data = optimizer.from_cbor2(cbor_data)
     print("Decoded from CBOR2:")
     print(json.dumps(decoded_data, indent=2))
 
@@ -1,3 +1,4 @@
+import selectors
 import socket
 
 class DataReceiver:
@@ -6,33 +7,87 @@ class DataReceiver:
     and outputs to the callback function.
     """
 
-    def __init__(self, host='0.0.0.0', port=8080, buffer_size=4096, callback=None):
+    __slots__ = ("host", "port", "buffer_size", "callback", "batch_callback", "max_batch", "sock", "_buf")
+
+    def __init__(self, host='0.0.0.0', port=8080, buffer_size=4096, callback=None,
+                 batch_callback=None, rcvbuf_size=1 << 20, max_batch=64):
+        """
+        Initialize the receiver.
+
+        Args:
+            host (str): UDP host to listen on
+            port (int): UDP port to listen on
+            buffer_size (int): Maximum datagram size
+            callback (callable): Called with each received datagram (bytes)
+            batch_callback (callable): If set, called once per wake-up with the list
+                                       of datagrams drained from the socket instead of callback
+            rcvbuf_size (int): Kernel receive buffer size, absorbs bursts while callbacks run
+            max_batch (int): Maximum number of datagrams drained per wake-up
+        """
         self.host = host
         self.port = port
         self.buffer_size = buffer_size
         self.callback = callback
+        self.batch_callback = batch_callback
+        self.max_batch = max_batch
+        # Preallocated receive buffer, reused for every datagram
+        self._buf = memoryview(bytearray(buffer_size))
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf_size)
         self.sock.bind((self.host, self.port))
+        self.sock.setblocking(False)
         # print(f"Listening on UDP {self.host}:{self.port}")
 
     def listen(self):
         """
         Main loop: listen for UDP packets and execute callback.
         """
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
         try:
             while True:
-                data, addr = self.sock.recvfrom(self.buffer_size)
-                self.callback(data)
+                selector.select()
+                batch = self._drain()
+                if not batch:
+                    continue
+                if self.batch_callback:
+                    self.batch_callback(batch)
+                else:
+                    for data in batch:
+                        self.callback(data)
 
         except KeyboardInterrupt:
             print("\nStopping receiver.")
         finally:
+            selector.close()
             self.sock.close()
 
+    def _drain(self):
+        """
+        Read all datagrams currently queued on the socket (up to max_batch).
+
+        Returns:
+            list: Received datagrams (bytes)
+        """
+        batch = []
+        buf = self._buf
+        recv_into = self.sock.recvfrom_into
+        while len(batch) < self.max_batch:
+            try:
+                nbytes, addr = recv_into(buf)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                # Windows reports ICMP port unreachable on UDP sockets; ignore it
+                continue
+            # Copy out: the buffer is overwritten by the next datagram
+            batch.append(bytes(buf[:nbytes]))
+        return batch
+
 
 if __name__ == "__main__":
     def my_callback(data):
         print(data)
-    
+
     receiver = DataReceiver(host="0.0.0.0", port=8080, callback=my_callback)
     receiver.listen()
@@ -0,0 +1,62 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to stdlib json
+    orjson = None
+
+
+# orjson.JSONDecodeError subclasses this, so one except clause covers both
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data):
+    """
+    Parse JSON from bytes or str (bytes are parsed without decoding to str first).
+
+    Args:
+        data (bytes or str): JSON document
+
+    Returns:
+        Parsed value.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj, indent=False):
+    """
+    Serialize to compact UTF-8 JSON bytes. Non-str dict keys are converted to str.
+
+    Args:
+        obj: Value to serialize
+        indent (bool): Pretty-print with 2-space indentation
+
+    Returns:
+        bytes: UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return dumps(obj, indent).encode()
+
+
+def dumps(obj, indent=False):
+    """
+    Serialize to a compact JSON string. Non-str dict keys are converted to str.
+
+    Args:
+        obj: Value to serialize
+        indent (bool): Pretty-print with 2-space indentation
+
+    Returns:
+        str: JSON text
+    """
+    if orjson is not None:
+        return dumps_bytes(obj, indent).decode()
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
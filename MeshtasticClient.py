@@ -1,5 +1,6 @@
 import meshtastic
 import meshtastic.serial_interface
+from meshtastic.protobuf import portnums_pb2
 import time
 from pubsub import pub
 
@@ -23,6 +24,7 @@ class MeshtasticClient:
         self.port = port
         self.receive_callback = receive_callback
         self.node_id = None
+        self._subscribed = False
     
     def connect(self):
         """
@@ -45,8 +47,9 @@ class MeshtasticClient:
             print(f"Connected to Meshtastic device. Node ID: {self.node_id}")
             
             # Subscribe to receive messages using pubsub if callback provided
-            if self.receive_callback:
+            if self.receive_callback and not self._subscribed:
                 pub.subscribe(self._on_message_received, "meshtastic.receive")
+                self._subscribed = True
             
             return True
         except Exception as e:
@@ -55,8 +58,10 @@ class MeshtasticClient:
     
     def disconnect(self):
         """Disconnect from the Meshtastic device."""
-        if self.receive_callback:
+        # pubsub raises for a topic that was never subscribed (e.g. connect failed)
+        if self._subscribed:
             pub.unsubscribe(self._on_message_received, "meshtastic.receive")
+            self._subscribed = False
         if self.device:
             self.device.close()
             print("Disconnected from Meshtastic device")
@@ -116,6 +121,61 @@ class MeshtasticClient:
             print(f"Failed to send channel message: {e}")
             return False
     
+    def send_direct_data(self, to_id, data):
+        """
+        Send a binary payload to a specific node (PRIVATE_APP port).
+        
+        Args:
+            to_id (int or str): Destination node ID
+            data (bytes): Payload to send.
+            
+        Returns:
+            bool: True if sent successfully, False otherwise.
+        """
+        try:
+            if not self.device:
+                print("Device not connected")
+                return False
+            
+            self.device.sendData(
+                data,
+                destinationId=to_id,
+                portNum=portnums_pb2.PortNum.PRIVATE_APP,
+                wantAck=False
+            )
+            return True
+        except Exception as e:
+            print(f"Failed to send direct data: {e}")
+            return False
+    
+    def send_channel_data(self, channel, data):
+        """
+        Send a binary payload to a channel (PRIVATE_APP port).
+        
+        Args:
+            channel (int): Channel number
+            data (bytes): Payload to send.
+            
+        Returns:
+            bool: True if sent successfully, False otherwise.
+        """
+        try:
+            if not self.device:
+                print("Device not connected")
+                return False
+            
+            self.device.sendData(
+                data,
+                destinationId='^all',
+                portNum=portnums_pb2.PortNum.PRIVATE_APP,
+                wantAck=False,
+                channelIndex=channel
+            )
+            return True
+        except Exception as e:
+            print(f"Failed to send channel data: {e}")
+            return False
+    
     def _on_message_received(self, packet, interface=None):
         """
         Internal callback for received messages using pubsub.
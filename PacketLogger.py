@@ -1,6 +1,7 @@
-import json
-from datetime import datetime
+import atexit
+import time
 from pathlib import Path
+from JsonCodec import dumps_bytes
 
 
 class PacketLogger:
@@ -8,35 +9,68 @@ class PacketLogger:
     Handles logging of sonde telemetry packets to daily JSONL files.
     Creates a separate log file for each day with format: packets_YYYY-MM-DD.jsonl
     """
+
+    __slots__ = ("log_dir", "flush_every", "_last_log_date", "_log_file", "_fh", "_pending", "_cached_ts")
     
-    def __init__(self, log_dir: str = "packet_logs"):
+    def __init__(self, log_dir: str = "packet_logs", flush_every: int = 1):
         """
         Initialize the packet logger.
         
         Args:
             log_dir (str): Directory to store log files (default: "packet_logs")
+            flush_every (int): Flush the log file every N packets (default: 1)
         """
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
+        self.flush_every = max(1, flush_every)
         
         self._last_log_date = None
         self._log_file = None
+        self._fh = None
+        self._pending = 0
+        # (second, date string, ISO prefix) formatted at most once per second
+        self._cached_ts = (None, None, None)
+        atexit.register(self.close)
+
+    def _timestamps(self):
+        """
+        Get the current date and ISO timestamp strings (local time).
+        The per-second parts are formatted once and reused within that second.
+
+        Returns:
+            tuple: (YYYY-MM-DD, YYYY-MM-DDTHH:MM:SS.ffffff)
+        """
+        now = time.time()
+        second = int(now)
+        cached_second, today, iso_prefix = self._cached_ts
+        if second != cached_second:
+            local = time.localtime(second)
+            today = time.strftime("%Y-%m-%d", local)
+            iso_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", local)
+            self._cached_ts = (second, today, iso_prefix)
+        return today, f"{iso_prefix}.{int((now - second) * 1e6):06d}"
     
-    def _get_log_file(self) -> Path:
+    def _get_log_file(self, today: str) -> Path:
         """
         Get the current log file, creating a new one if the date has changed.
         Creates separate log files for each day in YYYY-MM-DD format.
         
+        Args:
+            today (str): Current date in YYYY-MM-DD format
+
         Returns:
             Path: Path to the current log file
         """
-        today = datetime.now().strftime("%Y-%m-%d")
-        
-        # If date has changed, update to new log file
-        if today != self._last_log_date:
+
+        # If date has changed (or the last open failed), switch to the new log file
+        if today != self._last_log_date or self._fh is None:
+            self.close()
+            log_file = self.log_dir / f"packets_{today}.jsonl"
+            # Open first: if this fails, state stays unset and the next packet retries
+            fh = open(log_file, "ab", buffering=1 << 16)
+            self._fh = fh
+            self._log_file = log_file
             self._last_log_date = today
-            log_filename = f"packets_{today}.jsonl"
-            self._log_file = self.log_dir / log_filename
         
         return self._log_file
     
@@ -48,18 +82,32 @@ class PacketLogger:
             packet_data (dict): The packet data to log
         """
         try:
-            log_file = self._get_log_file()
+            today, now_iso = self._timestamps()
+            self._get_log_file(today)
             
             # Add timestamp if not present
             if "logged_at" not in packet_data:
-                packet_data["logged_at"] = datetime.now().isoformat()
+                packet_data["logged_at"] = now_iso
             
             # Append as JSON line
-            with open(log_file, "a") as f:
-                f.write(json.dumps(packet_data) + "\n")
+            self._fh.write(dumps_bytes(packet_data))
+            self._fh.write(b"\n")
+
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._fh.flush()
+                self._pending = 0
                 
         except Exception as e:
             print(f"Error logging packet: {e}")
+
+    def close(self):
+        """Flush and close the current log file, if open."""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            self._last_log_date = None
+            self._pending = 0
     
     def get_log_dir(self) -> Path:
         """
@@ -1,8 +1,13 @@
+import queue
+import threading
+import time
 import requests
 import json
-from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, RequestException, Timeout
+from urllib3.util.retry import Retry
 from ConfigLoader import ConfigLoader
-from rich.console import Console
+from JsonCodec import dumps_bytes
 
 class SondeHubClient:
     """
@@ -13,6 +18,29 @@ class SondeHubClient:
     # SondeHub API endpoint (PUT request)
     SONDEHUB_API_URL = "https://api.v2.sondehub.org/sondes/telemetry"
 
+    # Received packet keys that are renamed to SondeHub keys
+    FIELD_MAP = {
+        "model": "type",
+        "callsign": "serial",
+        "time": "datetime",
+        "latitude": "lat",
+        "longitude": "lon",
+        "altitude": "alt",
+        "freq": "frequency",
+    }
+
+    # SondeHub telemetry fields copied from the (renamed) packet
+    OUT_FIELDS = frozenset({
+        # Core location/altitude fields
+        "dev", "datetime", "lat", "lon", "alt",
+        # Sonde identification fields
+        "manufacturer", "type", "serial", "subtype",
+        # Telemetry fields
+        "frame", "frequency", "temp", "humidity", "pressure",
+        "vel_h", "vel_v", "heading", "batt", "sats",
+        "xdata", "snr", "rssi",
+    })
+
     def __init__(self):
         """Initialize the SondeHub client with configuration."""
         self.config = ConfigLoader.load_config()
@@ -22,13 +50,119 @@ class SondeHubClient:
         self.uploader_position = self.sondeHub_config.get("uploader_position", None)
         self.uploader_antenna = self.sondeHub_config.get("uploader_antenna", "")
         self.timeout = 10  # Default timeout in seconds
+        # Upload up to batch_size packets per request, waiting at most batch_interval seconds
+        self.batch_size = max(1, self.sondeHub_config.get("batch_size", 10))
+        self.batch_interval = self.sondeHub_config.get("batch_interval", 5)
+
+        # Persistent session: keeps the TLS connection to SondeHub alive between uploads
+        self._session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retries))
+        self._session.headers.update({
+            "Content-Type": "application/json",
+            "User-Agent": "sonde-lora-bridge"
+        })
+
+        # Background uploader so callers never block on the HTTP request
+        self._queue = queue.Queue(maxsize=256)
+        self._upload_thread = None
+        self.start()
+
+    def start(self):
+        """Start the background uploader (if enabled and not already running)."""
+        if not self.enabled:
+            return
+        if self._upload_thread is None or not self._upload_thread.is_alive():
+            self._upload_thread = threading.Thread(target=self._upload_loop, daemon=True)
+            self._upload_thread.start()
+
+    def close(self):
+        """Stop the background uploader and close the HTTP session."""
+        if self._upload_thread and self._upload_thread.is_alive():
+            try:
+                self._queue.put(None, timeout=1)  # Sentinel: stop after pending uploads
+            except queue.Full:
+                pass
+            self._upload_thread.join(timeout=self.timeout)
+        self._session.close()
+
+    @staticmethod
+    def _utc_timestamp():
+        """
+        Current UTC time as YYYY-MM-DDTHH:MM:SS.mmmZ, without building a datetime.
+
+        Returns:
+            str: Millisecond-precision ISO 8601 timestamp
+        """
+        now = time.time()
+        return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now))}.{int(now % 1 * 1000):03d}Z"
+
+    def submit_packet(self, decoded_packet):
+        """
+        Queue a decoded sonde packet for upload to SondeHub without blocking.
+
+        Args:
+            decoded_packet (dict): The decoded sonde data (see send_packet).
+
+        Returns:
+            bool: True if queued, False if disabled or the queue is full.
+        """
+        if not self.enabled:
+            return False
+
+        try:
+            self._queue.put_nowait(decoded_packet)
+            return True
+        except queue.Full:
+            print("SondeHub upload queue full, dropping packet")
+            return False
+
+    def _upload_loop(self):
+        """
+        Upload queued packets until the stop sentinel is received.
+        Packets are grouped into one request per batch_size packets or
+        batch_interval seconds after the first one, whichever comes first.
+        """
+        get = self._queue.get
+        running = True
+        while running:
+            decoded_packet = get()
+            if decoded_packet is None:
+                break
+            batch = [decoded_packet]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    decoded_packet = get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if decoded_packet is None:
+                    running = False  # Upload what we have, then stop
+                    break
+                batch.append(decoded_packet)
+            self.send_packets(batch)
 
     def send_packet(self, decoded_packet):
         """
         Send a decoded sonde packet to SondeHub.
 
         Args:
-            decoded_packet (dict): The decoded sonde data containing at minimum:
+            decoded_packet (dict): The decoded sonde data (see send_packets).
+
+        Returns:
+            bool: True if sent successfully, False otherwise.
+        """
+        return self.send_packets([decoded_packet])
+
+    def send_packets(self, decoded_packets):
+        """
+        Send several decoded sonde packets to SondeHub in a single request.
+
+        Args:
+            decoded_packets (list): Decoded sonde data dicts, each containing at minimum:
                 - datetime: ISO 8601 timestamp
                 - lat: Latitude
                 - lon: Longitude
@@ -43,35 +177,45 @@ class SondeHubClient:
 
         try:
             # Prepare the payload for SondeHub (as an array of objects)
-            payload = [self._prepare_payload(decoded_packet)]
+            prepare = self._prepare_payload
+            payload = [prepare(decoded_packet) for decoded_packet in decoded_packets]
 
-            # Prepare headers as per SondeHub API spec
+            # Prepare headers as per SondeHub API spec (static headers are set on the session)
             headers = {
-                "Content-Type": "application/json",
-                "User-Agent": "sonde-lora-bridge",
-                "Date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+                "Date": self._utc_timestamp()
             }
 
+            # Serialize the body ourselves as UTF-8 bytes
+            body = dumps_bytes(payload)
+
             # Send to SondeHub using PUT request
-            response = requests.put(
+            response = self._session.put(
                 self.SONDEHUB_API_URL,
-                json=payload,
+                data=body,
                 timeout=self.timeout,
                 headers=headers
             )
 
             if response.status_code == 200:
-                print(f"Packet sent to SondeHub")
+                print(f"{len(payload)} packet(s) sent to SondeHub")
                 return True
+            elif response.status_code == 413 and len(decoded_packets) > 1:
+                # Batch too large for the server: fall back to one request per packet
+                print(f"SondeHub rejected a batch of {len(decoded_packets)} packets as too large, sending individually")
+                results = [self.send_packets([decoded_packet]) for decoded_packet in decoded_packets]
+                return all(results)
             else:
                 print(f"SondeHub error ({response.status_code}): {response.text}")
                 return False
 
-        except requests.exceptions.Timeout:
-            print(f"SondeHub request timeout ({self.timeout}s)")
-            return False
-        except requests.exceptions.ConnectionError as e:
-            print(f"SondeHub connection error: {e}")
+        except RequestException as e:
+            # Timeout first: ConnectTimeout is both a Timeout and a ConnectionError
+            if isinstance(e, Timeout):
+                print(f"SondeHub request timeout ({self.timeout}s)")
+            elif isinstance(e, RequestsConnectionError):
+                print(f"SondeHub connection error: {e}")
+            else:
+                print(f"Error sending to SondeHub: {e}")
             return False
         except Exception as e:
             print(f"Error sending to SondeHub: {e}")
@@ -95,34 +239,15 @@ class SondeHubClient:
             "uploader_callsign": self.uploader_callsign
         }
 
-        # Convert field mappings from received packet keys to SondeHub keys
-        field_mapping = {
-            "model": "type",
-            "callsign": "serial",
-            "time": "datetime",
-            "latitude": "lat",
-            "longitude": "lon",
-            "altitude": "alt",
-            "freq": "frequency",
-        }
-        
-        # Apply field mappings to decoded_packet
-        mapped_packet = decoded_packet.copy()
-        for old_key, new_key in field_mapping.items():
-            if old_key in mapped_packet and old_key != new_key:
-                mapped_packet[new_key] = mapped_packet.pop(old_key)
-
-        # Core location/altitude fields
-        core_fields = ["dev", "datetime", "lat", "lon", "alt"]
-        for field in core_fields:
-            if field in mapped_packet:
-                telemetry[field] = mapped_packet[field]
-
-        # Sonde identification fields
-        id_fields = ["manufacturer", "type", "serial", "subtype"]
-        for field in id_fields:
-            if field in mapped_packet:
-                telemetry[field] = mapped_packet[field]
+        # Rename received packet keys to SondeHub keys and keep only known fields (single pass)
+        field_map = self.FIELD_MAP
+        out_fields = self.OUT_FIELDS
+        for key, value in decoded_packet.items():
+            out_key = field_map.get(key)
+            if out_key is not None:
+                telemetry[out_key] = value  # Mapped names take precedence
+            elif key in out_fields:
+                telemetry.setdefault(key, value)
 
         # Normalize type field: IMET -> iMet (case insensitive)
         if "type" in telemetry and telemetry["type"].upper() == "IMET":
@@ -132,24 +257,12 @@ class SondeHubClient:
         if "serial" in telemetry and "IMET-" in telemetry["serial"].upper():
                 telemetry["serial"] = telemetry["serial"].upper().replace("IMET-", "")
 
-        # Telemetry fields
-        telemetry_fields = [
-            "frame", "frequency", "temp", "humidity", "pressure",
-            "vel_h", "vel_v", "heading", "batt", "sats",
-            "xdata", "snr", "rssi"
-        ]
-        for field in telemetry_fields:
-            if field in mapped_packet:
-                telemetry[field] = mapped_packet[field]
-
         # Uploader information
         if self.uploader_position:
             telemetry["uploader_position"] = self.uploader_position
         if self.uploader_antenna:
             telemetry["uploader_antenna"] = self.uploader_antenna
-        
-        console = Console()
-        console.print_json(data=telemetry)
+
         return telemetry
 
 if __name__ == "__main__":
@@ -1,14 +1,17 @@
 from DataReceiver import DataReceiver
 from WorkloadManager import WorkloadManager
-from DataOptimizer import DataOptimizer
+from DataOptimizer import DataOptimizer, optimizer
 from MeshtasticClient import MeshtasticClient
 from ConfigLoader import ConfigLoader
-from datetime import datetime, timezone
-import json
+from JsonCodec import JSONDecodeError, loads
+import binascii
+import concurrent.futures
+import logging
 import threading
-import time
 from datetime import datetime, date
 
+logger = logging.getLogger(__name__)
+
 
 class SondeLoraBridge:
     """
@@ -17,8 +20,17 @@ class SondeLoraBridge:
     The manager buffers data and triggers decoding.
     """
 
+    # Fields forwarded over LoRa, in transmit order ("time" and "freq" are converted).
+    # Not forwarded: type, station, manufacturer, speed, heading, comment,
+    # sdr_device_idx, vel_v, vel_h, bt
+    DTO_FIELDS = (
+        "model", "callsign", "frame", "time", "latitude", "longitude", "altitude",
+        "freq", "snr", "temp", "humidity", "pressure", "sats", "batt", "subtype",
+    )
+
     def __init__(self, host='0.0.0.0', port=8080, count_threshold=10, 
-                 time_threshold=15, meshtastic_port=None, target_device_id=None, channel=None):
+                 time_threshold=15, meshtastic_port=None, target_device_id=None, channel=None,
+                 array_layout=False, binary_payload=False):
         """
         Initialize the bridge.
 
@@ -30,57 +42,118 @@ class SondeLoraBridge:
             meshtastic_port (str): Serial port for Meshtastic device
             target_device_id (str): Target Meshtastic device ID for direct messages
             channel (int): Target channel ID for channel messages
+            array_layout (bool): Encode packets as a fixed-order CBOR array instead of a map
+            binary_payload (bool): Send raw CBOR bytes on the PRIVATE_APP port instead of hex text
         """
         # Create the workload manager with internal callback
         self.manager = WorkloadManager(
             count_threshold=count_threshold,
             time_threshold=time_threshold,
-            callback=self.process_data
+            callback=self._submit_process
         )
 
+        # Process packets off the receive path so UDP draining never waits on the
+        # serial port. A single worker keeps packets in arrival order.
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sonde-proc")
+        # Set by stop(): late manager callbacks are dropped instead of submitted
+        self._stopped = threading.Event()
+
         # Create the UDP listener with callback to send data to manager
         self.listener = DataReceiver(
             host=host,
             port=port,
-            callback=self._on_data_received
+            callback=self._on_data_received,
+            batch_callback=self._on_batch_received
         )
         
-        # Initialize the data optimizer
-        self.optimizer = DataOptimizer()
+        # Use the shared data optimizer unless a non-default layout is requested
+        self.optimizer = DataOptimizer(array_layout=True) if array_layout else optimizer
         
         # Initialize Meshtastic client
         self.meshtastic_client = MeshtasticClient(port=meshtastic_port)
         self.target_device_id = target_device_id
         self.channel = channel
+        self.binary_payload = binary_payload
+        # The Meshtastic serial interface is not thread-safe: every call goes through this lock
+        self._mt_lock = threading.RLock()
+        # Cleared while the device restarts after a reboot command
+        self._mt_ready = threading.Event()
+        self._mt_ready.set()
         
         # Reboot timer
         self.reboot_thread = None
         self.reboot_interval = 3600  # 1 hour in seconds
-        self.stop_reboot_timer = False
+        self.reboot_settle_time = 20  # Seconds until the device is usable again (reboot is delayed ~10 s)
+        self._reboot_stop = threading.Event()
 
-    def _on_data_received(self, data: str):
+    def _on_data_received(self, data: bytes):
         """
         Internal callback that receives encoded data from listener
         and forwards it to the manager.
 
         Args:
-            data (str): encoded data from the listener
+            data (bytes): raw UDP datagram from the listener
         """
         if data:
             self.manager.addWork(data)
             #print(data)
             #print(f"Data received and forwarded to manager: {len(data)} bytes")
 
+    def _on_batch_received(self, batch):
+        """
+        Internal callback that receives all datagrams drained in one
+        listener wake-up and forwards them to the manager together.
+
+        Args:
+            batch (list): raw UDP datagrams (bytes) from the listener
+        """
+        batch = [data for data in batch if data]
+        if batch:
+            self.manager.addWorkBulk(batch)
+
+    def _submit_process(self, raw_data):
+        """
+        WorkloadManager callback: queue the selected packet for process_data
+        on the worker thread and return immediately.
+
+        Args:
+            raw_data (bytes): JSON-encoded payload summary data
+        """
+        if self._stopped.is_set():
+            return
+        try:
+            future = self._pool.submit(self.process_data, raw_data)
+        except RuntimeError:
+            # The pool was shut down between the check above and submit
+            return
+        future.add_done_callback(self._on_process_done)
+
+    @staticmethod
+    def _on_process_done(future):
+        """
+        Report an exception that escaped process_data on the worker thread.
+
+        Args:
+            future (concurrent.futures.Future): Finished process_data call
+        """
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error processing payload: {future.exception()!r}")
+
     def start(self):
         """Start listening for UDP packets."""
         self.listener.listen()
 
     def stop(self):
         """Stop listening and flush any remaining data."""
-        self.stop_reboot_timer = True
+        self._reboot_stop.set()
+        # Hand over the buffered packet, then stop accepting work (flush also cancels the timer)
         self.manager.flush()
-        if self.meshtastic_client.is_connected():
-            self.meshtastic_client.disconnect()
+        self._stopped.set()
+        # Let queued packets finish sending before disconnecting
+        self._pool.shutdown(wait=True)
+        with self._mt_lock:
+            if self.meshtastic_client.is_connected():
+                self.meshtastic_client.disconnect()
     
     def start_reboot_timer(self, interval=3600):
         """
@@ -90,22 +163,27 @@ class SondeLoraBridge:
             interval (int): Interval in seconds between reboots (default: 3600 = 1 hour)
         """
         self.reboot_interval = interval
-        self.stop_reboot_timer = False
+        self._reboot_stop.clear()
         self.reboot_thread = threading.Thread(target=self._reboot_loop, daemon=True)
         self.reboot_thread.start()
         print(f"Reboot timer started with interval: {interval} seconds")
     
     def _reboot_loop(self):
-        """Internal loop for periodic reboots."""
-        while not self.stop_reboot_timer:
-            time.sleep(self.reboot_interval)
-            if not self.stop_reboot_timer and self.meshtastic_client.is_connected():
+        """Internal loop for periodic reboots. Returns as soon as the stop event is set."""
+        while not self._reboot_stop.wait(self.reboot_interval):
+            with self._mt_lock:
+                if not self.meshtastic_client.is_connected():
+                    continue
                 print("Triggering periodic device reboot...")
+                self._mt_ready.clear()
                 self.meshtastic_client.reboot()
+            # Hold off senders (without holding the lock) until the device is back
+            self._reboot_stop.wait(self.reboot_settle_time)
+            self._mt_ready.set()
     
     def stop_reboot_timer_func(self):
         """Stop the reboot timer."""
-        self.stop_reboot_timer = True
+        self._reboot_stop.set()
         if self.reboot_thread:
             self.reboot_thread.join(timeout=5)
         print("Reboot timer stopped")
@@ -115,21 +193,23 @@ class SondeLoraBridge:
         Process JSON payload summary data and create a minimal packet.
 
         Args:
-            raw_data (str): JSON-encoded payload summary data
+            raw_data (bytes or str): JSON-encoded payload summary data (bytes are parsed without decoding to str)
         """
         try:
-            
+            # Cheap scan before parsing: other packet types cannot contain this token
+            token = '"PAYLOAD_SUMMARY"' if isinstance(raw_data, str) else b'"PAYLOAD_SUMMARY"'
+            if token not in raw_data:
+                print("Unsupported packet type (not PAYLOAD_SUMMARY)")
+                return
+
             # Parse JSON data
-            data = json.loads(raw_data)
+            data = loads(raw_data)
             
             # Check if this is a PAYLOAD_SUMMARY type
             if data.get("type") != "PAYLOAD_SUMMARY":
                 print(f"Unsupported packet type: {data.get('type')}")
                 return
             
-            # Add timestamp
-            now_iso = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-            
             # Convert time from data to ISO format
             time_value = data.get("time", "")
             dt = datetime.combine(
@@ -143,63 +223,55 @@ class SondeLoraBridge:
                 freq_value = float(freq_value.replace("MHz", ""))
 
             # Create minimal DTO from JSON fields
-            dto = {
-            #"type": data.get("type", ""),
-            #"station": data.get("station", ""),
-            #"manufacturer": data.get("manufacturer", ""),
-            "model": data.get("model", ""),
-            "callsign": data.get("callsign", ""),
-            "frame": data.get("frame", ""),
-            "time": time_iso,
-            "latitude": data.get("latitude", ""),
-            "longitude": data.get("longitude", ""),
-            "altitude": data.get("altitude", ""),
-            "freq": freq_value,            
-            "snr": data.get("snr", ""),
-            "temp": data.get("temp", ""),            
-            "humidity": data.get("humidity", ""),
-            "pressure": data.get("pressure", ""),
-            "sats": data.get("sats", ""),
-            "batt": data.get("batt", ""),
-            "subtype": data.get("subtype", ""),
-            #"speed": data.get("speed", ""),
-            #"heading": data.get("heading", ""),
-            #"comment": data.get("comment", ""),
-            #"sdr_device_idx": data.get("sdr_device_idx", ""),
-            #"vel_v": data.get("vel_v", ""),
-            #"vel_h": data.get("vel_h", ""),
-            #"bt": data.get("bt", ""),             
-            }
+            get = data.get
+            dto = {key: get(key, "") for key in self.DTO_FIELDS}
+            dto["time"] = time_iso
+            dto["freq"] = freq_value
             
-            # Convert DTO to CBOR2
+            # Convert DTO to CBOR2 (integer keys, see DataOptimizer.FIELD_CONFIG)
             cbor_data = self.optimizer.to_cbor2(dto)
-            print(cbor_data.hex())
+            # Hex-encode once, and only if it is sent as text or logged
+            cbor_hex = None
+            if not self.binary_payload or logger.isEnabledFor(logging.DEBUG):
+                cbor_hex = binascii.hexlify(cbor_data).decode("ascii")
+                logger.debug("CBOR payload (%d bytes): %s", len(cbor_data), cbor_hex)
             
-            # Send CBOR data via Meshtastic
-            # First, check if connected
-            if not self.meshtastic_client.is_connected():
-                print("Connecting to Meshtastic device...")
-                if not self.meshtastic_client.connect():
-                    print("Failed to connect to Meshtastic device.")
-                    return
-                print("Connected to Meshtastic device.")
+            # Avoid sending into a device mid-reset; give up waiting after a few seconds
+            if not self._mt_ready.wait(timeout=3):
+                print("Meshtastic device is still rebooting, sending anyway")
+
+            # Send CBOR data via Meshtastic (one sender at a time on the serial port)
+            with self._mt_lock:
+                # First, check if connected
+                if not self.meshtastic_client.is_connected():
+                    print("Connecting to Meshtastic device...")
+                    if not self.meshtastic_client.connect():
+                        print("Failed to connect to Meshtastic device.")
+                        return
+                    print("Connected to Meshtastic device.")
             
-            # Check if target_device_id is set
-            if self.target_device_id:
-                self.meshtastic_client.send_direct_message(
-                    self.target_device_id,
-                    f"{cbor_data.hex()}"
-                )
-                print(f"Data sent to device{self.target_device_id}")
-            # Check if channel is set
-            elif self.channel:
-                self.meshtastic_client.send_channel_message(
-                    self.channel,
-                    f"{cbor_data.hex()}"
-                )
-                print(f"Data sent to channel {self.channel}")
+                # Check if target_device_id is set
+                if self.target_device_id:
+                    if self.binary_payload:
+                        self.meshtastic_client.send_direct_data(self.target_device_id, cbor_data)
+                    else:
+                        self.meshtastic_client.send_direct_message(
+                            self.target_device_id,
+                            cbor_hex
+                        )
+                    print(f"Data sent to device{self.target_device_id}")
+                # Check if channel is set
+                elif self.channel:
+                    if self.binary_payload:
+                        self.meshtastic_client.send_channel_data(self.channel, cbor_data)
+                    else:
+                        self.meshtastic_client.send_channel_message(
+                            self.channel,
+                            cbor_hex
+                        )
+                    print(f"Data sent to channel {self.channel}")
         
-        except json.JSONDecodeError as e:
+        except JSONDecodeError as e:
             print(f"Error parsing JSON: {e}")
         except Exception as e:
             print(f"Error processing payload: {e}")
@@ -207,6 +279,8 @@ class SondeLoraBridge:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+
     # Load config
     config = ConfigLoader.load_config()
 
@@ -219,6 +293,8 @@ if __name__ == "__main__":
     meshtastic_port = bridge_config.get("meshtastic_port", None)
     target_device_id = bridge_config.get("target_device_id", None)
     channel = bridge_config.get("channel", None)
+    array_layout = bridge_config.get("array_layout", False)
+    binary_payload = bridge_config.get("binary_payload", False)
 
     bridge = SondeLoraBridge(
         host=host,
@@ -227,7 +303,9 @@ if __name__ == "__main__":
         time_threshold=time_threshold,
         meshtastic_port=meshtastic_port,
         target_device_id=target_device_id,
-        channel=channel
+        channel=channel,
+        array_layout=array_layout,
+        binary_payload=binary_payload
     )
 
     if bridge.meshtastic_client.connect():
@@ -1,10 +1,20 @@
 from MeshtasticClient import MeshtasticClient
-from DataOptimizer import DataOptimizer
+from DataOptimizer import optimizer
 from PacketLogger import PacketLogger
 from SondeHubClient import SondeHubClient
 from ConfigLoader import ConfigLoader
-import json
-import time
+from JsonCodec import dumps
+import binascii
+from cbor2 import CBORDecodeError
+import logging
+import os
+import queue
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+_BANNER = "=" * 50
 
 
 class SondeLoraClient:
@@ -13,7 +23,7 @@ class SondeLoraClient:
     sonde packets, then decodes and displays them.
     """
 
-    def __init__(self, port=None, channel=None, source_device_id=None, on_sonde_packet=None):
+    def __init__(self, port=None, channel=None, source_device_id=None, on_sonde_packet=None, verbose=False):
         """
         Initialize the sonde client.
         
@@ -23,13 +33,18 @@ class SondeLoraClient:
             channel (int): Specific channel to listen on. If None, listens to all channels.
             source_device_id (int or str): Specific source device ID to listen to. 
                                         If None, listens to all sources.
+            on_sonde_packet (callable): Called with each decoded packet (dict).
+            verbose (bool): Print every decoded packet to stdout.
         """
         # Callback for when a sonde packet is received
         self.on_sonde_packet = on_sonde_packet
+        self.verbose = verbose
 
-        self.optimizer = DataOptimizer()
+        self.optimizer = optimizer
         self.channel = channel
+        self._channel = int(channel) if channel else None  # packet["channel"] is an int
         self.source_device_id = source_device_id
+        self._source_id = self._parse_node_id(source_device_id)
         self.meshtastic_client = MeshtasticClient(
             port=port,
             receive_callback=self.on_message_received
@@ -38,6 +53,21 @@ class SondeLoraClient:
         # Initialize packet logger and SondeHub client
         self.packet_logger = PacketLogger()
         self.sondehub_client = SondeHubClient()
+
+        # Bound methods used for every received packet
+        self._decode = self.optimizer.from_cbor2
+        self._log = self.packet_logger.log_packet
+        self._submit = self.sondehub_client.submit_packet
+
+        # Set on disconnect to release listen()
+        self._stop = threading.Event()
+
+        # Logging and SondeHub submission run on a background thread so disk
+        # or upload stalls never hold up the Meshtastic receive thread
+        self.dropped_packets = 0
+        self._io_queue = queue.Queue(maxsize=1024)
+        self._io_thread = None
+        self._start_io_thread()
     
     def on_message_received(self, packet):
         """
@@ -47,59 +77,96 @@ class SondeLoraClient:
             packet (dict): Message packet from Meshtastic device
         """
         try:
-            valid_channel = True
-            valid_source_device = True
-
-            # Filter by channel if specified
-            if self.channel is not None:
-                packet_channel = packet.get("channel")
-                if packet_channel != self.channel:
-                    valid_channel = False
-
-            # Filter by source device ID if specified
-            if self.source_device_id is not None:
-                from_id = packet.get("from")
-                # Convert to same type for comparison
-                source_id = int(self.source_device_id) if isinstance(self.source_device_id, str) else self.source_device_id
-                if from_id != source_id:
-                    valid_source_device = False
-            
-            # Ignore this packet if both filters do not match
-            if ((self.channel and not valid_channel) or (self.source_device_id and not valid_source_device)):
+            # Ignore packets from other channels / devices (a falsy setting disables the filter)
+            if self._channel and packet.get("channel") != self._channel:
+                return
+            if self._source_id and packet.get("from") != self._source_id:
                 return
 
-            # Check if packet has text content (hex-encoded CBOR data)
-            if "decoded" in packet and "text" in packet["decoded"]:
-                text_payload = packet["decoded"]["text"]
-                
-                # Try to decode as hex CBOR
+            decoded = packet.get("decoded", {})
+
+            # Raw CBOR bytes on the PRIVATE_APP port (bridge binary_payload mode)
+            # or hex-encoded CBOR in a text message
+            if decoded.get("portnum") == "PRIVATE_APP" and "payload" in decoded:
+                payload = decoded["payload"]
+            elif "text" in decoded:
+                payload = decoded["text"]
+            else:
+                payload = None
+
+            if payload is not None:
+                # Try to decode as CBOR; other text messages on the channel are not hex/CBOR
+                try:
+                    if isinstance(payload, str):
+                        logger.debug("Text message received: %s", payload)
+                        payload = binascii.a2b_hex(payload)
+                    decoded_data = self._decode(payload)
+                except (ValueError, CBORDecodeError) as e:
+                    logger.debug("Could not decode as CBOR: %s", e)
+                    return
+
+                if self.verbose:
+                    text = dumps(decoded_data, indent=True)
+                    # One write instead of one print per line
+                    sys.stdout.write(f"{_BANNER}\nSONDE DATA RECEIVED\n{_BANNER}\n{text}\n{_BANNER}\n\n")
+
+                # Queue for logging and upload to SondeHub (non-blocking)
                 try:
-                    cbor_bytes = bytes.fromhex(text_payload)
-                    decoded_data = self.optimizer.from_cbor2(cbor_bytes)
-                    
-                    print(f"Text message received: {text_payload}\n")
-                    print("="*50)
-                    print("SONDE DATA RECEIVED")
-                    print("="*50)
-                    print(json.dumps(decoded_data, indent=2))
-                    print("="*50 + "\n")
-                    
-                    # Log the decoded packet
-                    self.packet_logger.log_packet(decoded_data)
-
-                    # Send to SondeHub
-                    self.sondehub_client.send_packet(decoded_data)
-
-                    if self.on_sonde_packet:
-                        self.on_sonde_packet(decoded_data)
-
-                except Exception as e:
-                    pass
-                    #print(f"Could not decode as CBOR: {e}")
+                    self._io_queue.put_nowait(decoded_data)
+                except queue.Full:
+                    self.dropped_packets += 1
+                    print(f"Packet I/O queue full, dropping packet ({self.dropped_packets} dropped)")
+
+                if self.on_sonde_packet:
+                    self.on_sonde_packet(decoded_data)
         
         except Exception as e:
             print(f"Error processing received packet: {e}")
     
+    def _start_io_thread(self):
+        """Start the packet I/O worker unless it is already running."""
+        if self._io_thread is None or not self._io_thread.is_alive():
+            self._io_thread = threading.Thread(target=self._io_worker, daemon=True)
+            self._io_thread.start()
+
+    def _io_worker(self):
+        """Log and submit queued packets until the stop sentinel is received."""
+        get = self._io_queue.get
+        while True:
+            decoded_data = get()
+            if decoded_data is None:
+                break
+            try:
+                self._log(decoded_data)
+                self._submit(decoded_data)
+            except Exception as e:
+                print(f"Error handling received packet: {e}")
+
+    @staticmethod
+    def _parse_node_id(node_id):
+        """
+        Convert a configured node ID to the numeric form used in packet["from"].
+
+        Args:
+            node_id (int or str): Node number, decimal string, or Meshtastic "!hex" ID
+
+        Returns:
+            int: Node number, or None if node_id is None or empty.
+
+        Raises:
+            ValueError: If a string node ID cannot be parsed.
+        """
+        if not isinstance(node_id, str):
+            return node_id
+        if not node_id:
+            return None
+        try:
+            if node_id.startswith("!"):
+                return int(node_id[1:], 16)
+            return int(node_id)
+        except ValueError:
+            raise ValueError(f"Invalid source device ID: {node_id!r}") from None
+
     def connect(self):
         """
         Connect to the Meshtastic device and start listening for packets.
@@ -107,23 +174,35 @@ class SondeLoraClient:
         Returns:
             bool: True if connected successfully, False otherwise.
         """
+        # Re-arm listen(), the I/O worker and the SondeHub uploader after a previous disconnect
+        self._stop.clear()
+        self._start_io_thread()
+        self.sondehub_client.start()
         return self.meshtastic_client.connect()
     
     def disconnect(self):
         """Disconnect from the Meshtastic device."""
+        self._stop.set()
         self.meshtastic_client.disconnect()
+        # Finish logging/submitting received packets before closing the uploader
+        if self._io_thread.is_alive():
+            self._io_queue.put(None)
+            self._io_thread.join(timeout=5)
+        self.sondehub_client.close()
     
     def listen(self):
         """
-        Start listening for messages. This blocks until interrupted.
+        Start listening for messages. This blocks until interrupted or disconnected.
         """
         try:
             print("Listening for sonde packets...")
             print("Press Ctrl+C to stop.\n")
             
-            # Keep the listener running
-            while True:
-                time.sleep(1)
+            # Packets arrive on Meshtastic's own thread; just block until stopped.
+            # Windows cannot interrupt a lock wait with Ctrl+C, so poll there.
+            timeout = 1 if os.name == "nt" else None
+            while not self._stop.wait(timeout):
+                pass
         
         except KeyboardInterrupt:
             print("\n\nStopping listener...")
@@ -131,14 +210,18 @@ class SondeLoraClient:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+
     # Load config
     config = ConfigLoader.load_config()
 
     meshtastic_port = config.get("client", {}).get("meshtastic_port", None)
     channel = config.get("client", {}).get("channel", None)
     source_device_id = config.get("client", {}).get("source_device_id", None)
+    verbose = config.get("client", {}).get("verbose", False)
 
-    client = SondeLoraClient(port=meshtastic_port, channel=channel, source_device_id=source_device_id)
+    client = SondeLoraClient(port=meshtastic_port, channel=channel, source_device_id=source_device_id,
+                             verbose=verbose)
 
     if client.connect():
         print(f"Connected on port: {meshtastic_port}")
@@ -1,4 +1,3 @@
-
 import time
 import threading
 
@@ -23,10 +22,12 @@ class WorkloadManager:
         self.time_threshold = time_threshold
         self.callback = callback
         self.counter = 0
-        self.start_time = None
-        self.data_buffer = []
-        self._timer_thread = None
-        self._stop_event = threading.Event()
+        # Only the most recent item is ever passed to the callback, so keep just that
+        self._last = None
+        # One-shot timer armed by the first buffered item; the lock serializes
+        # callers with the timer thread
+        self._timer = None
+        self._lock = threading.Lock()
 
     def addWork(self, data):
         """
@@ -35,17 +36,41 @@ class WorkloadManager:
         Args:
             data: The data to buffer
         """
-        # Add data to buffer
-        self.data_buffer.append(data)
-        self.counter += 1
+        with self._lock:
+            # Remember the item and count it
+            self._last = data
+            self.counter += 1
+
+            # Start timer if this is the first item
+            if self.counter == 1:
+                self._start_timer()
 
-        # Start timer if this is the first item
-        if self.counter == 1:
-            self.start_time = time.time()
-            self._start_timer()
+            # check counter threshold
+            self._check_counter_threshold()
 
-        # check counter threshold
-        self._check_counter_threshold()
+    def addWorkBulk(self, items):
+        """
+        Receive several data items at once. Equivalent to calling addWork
+        for each item, but counts them in runs up to the count threshold.
+
+        Args:
+            items (list): The data items to buffer, oldest first
+        """
+        with self._lock:
+            start, end = 0, len(items)
+            while start < end:
+                # Take only as many items as fit before the count threshold
+                stop = min(end, start + max(1, self.count_threshold - self.counter))
+                self._last = items[stop - 1]
+                first = self.counter == 0
+                self.counter += stop - start
+                start = stop
+
+                # Start timer if this run holds the first item
+                if first:
+                    self._start_timer()
+
+                self._check_counter_threshold()
 
     def _check_counter_threshold(self):
         """Check if count threshold is reached."""
@@ -53,46 +78,41 @@ class WorkloadManager:
             self._trigger_callback()
 
     def _trigger_callback(self):
-        """Execute callback for the last buffered data item and reset."""
-        if self.callback and self.data_buffer:
-            self.callback(self.data_buffer[-1])
+        """Execute callback for the last buffered data item and reset. Called with the lock held."""
+        self._stop_timer()
+
+        if self.callback and self.counter:
+            self.callback(self._last)
 
         # Reset state
         self.counter = 0
-        self.start_time = None
-        self.data_buffer = []
-        self._stop_timer()
+        self._last = None
 
     def flush(self):
-        """Manually trigger callback with any remaining data."""
-        if self.counter > 0:
-            self._trigger_callback()
+        """Manually trigger callback with any remaining data and cancel the pending timer."""
+        with self._lock:
+            if self.counter > 0:
+                self._trigger_callback()
+            else:
+                self._stop_timer()
 
     def _start_timer(self):
-        self._stop_event.clear()
-        if self._timer_thread is None or not self._timer_thread.is_alive():
-            self._timer_thread = threading.Thread(target=self._timer_check, daemon=True)
-            self._timer_thread.start()
+        self._timer = threading.Timer(self.time_threshold, self._on_timeout)
+        self._timer.daemon = True
+        self._timer.start()
 
     def _stop_timer(self):
-        self._stop_event.set()
-        # Avoid joining the current thread to prevent RuntimeError
-        if (
-            self._timer_thread
-            and self._timer_thread.is_alive()
-            and threading.current_thread() != self._timer_thread
-        ):
-            self._timer_thread.join(timeout=0.1)
-        self._timer_thread = None
-
-    def _timer_check(self):
-        while not self._stop_event.is_set():
-            if self.start_time is not None:
-                elapsed = time.time() - self.start_time
-                if elapsed >= self.time_threshold:
-                    self._trigger_callback()
-                    break
-            time.sleep(0.1)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timeout(self):
+        """Timer callback: trigger unless the buffer was already handled meanwhile."""
+        with self._lock:
+            # A timer that fired while a count trigger held the lock belongs to an
+            # already-processed buffer (Timer is a Thread, so compare identities)
+            if self._timer is threading.current_thread() and self.counter > 0:
+                self._trigger_callback()
 
 
 if __name__ == "__main__":
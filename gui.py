@@ -1,15 +1,29 @@
-import json
 import sys
+from collections import deque
+from pathlib import Path
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
     QWidget,
     QVBoxLayout,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QLabel
 )
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
+from PyQt6.QtCore import (
+    QAbstractTableModel,
+    QModelIndex,
+    QObject,
+    QSortFilterProxyModel,
+    QStandardPaths,
+    QThread,
+    QTimer,
+    QUrl,
+    pyqtSignal,
+    pyqtSlot,
+    Qt
+)
+from PyQt6.QtWebChannel import QWebChannel
+from PyQt6.QtWebEngineCore import QWebEngineSettings
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtWidgets import QPushButton
 
@@ -17,6 +31,9 @@ from SondeLoraClient import SondeLoraClient
 from ConfigLoader import ConfigLoader
 
 
+# Most packets held for the map while its page is not ready (oldest are dropped)
+MAX_PENDING_MAP_PACKETS = 500
+
 LEAFLET_HTML = """
 <!DOCTYPE html>
 <html>
@@ -30,6 +47,7 @@ LEAFLET_HTML = """
     href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"
   />
   <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+  <script src="qrc:///qtwebchannel/qwebchannel.js"></script>
 
   <style>
     html, body, #map {
@@ -41,6 +59,17 @@ LEAFLET_HTML = """
 <body>
 <div id="map"></div>
 
+<script>
+  // Python link (see MapBridge in gui.py), set up in its own script so it still
+  // connects if Leaflet failed to load; updates are dropped until the map exists
+  new QWebChannel(qt.webChannelTransport, channel => {
+    const bridge = channel.objects.mapBridge;
+    bridge.packets.connect(packets => { if (window.addPackets) window.addPackets(packets); });
+    bridge.cleared.connect(() => { if (window.clearTracks) window.clearTracks(); });
+    bridge.ready();
+  });
+</script>
+
 <script>
   const map = L.map('map').setView([31.8, 34.7], 7);
 
@@ -49,8 +78,12 @@ LEAFLET_HTML = """
     attribution: '&copy; OpenStreetMap contributors'
   }).addTo(map);
 
+  // Keep at most this many track points (line and dots) per callsign
+  const MAX_TRACK_POINTS = 500;
+
   const callsignColors = {};
   const tracks = {};
+  const trackDots = {};
   const lastBalloon = {};
   const markerLayer = L.layerGroup().addTo(map);
 
@@ -63,8 +96,20 @@ LEAFLET_HTML = """
     return `hsl(${hue}, 80%, 50%)`;
   }
 
+  // DivIcons only hold options, so one per color can be shared by all markers
+  const iconCache = {};
+
   function balloonIcon(color) {
-    const svg = `
+    return iconCache[color] || (iconCache[color] = L.divIcon({
+      html: balloonSvg(color),
+      className: "",
+      iconSize: [24, 36],
+      iconAnchor: [12, 36]
+    }));
+  }
+
+  function balloonSvg(color) {
+    return `
       <svg
       xmlns="http://www.w3.org/2000/svg"
       width="32"
@@ -81,15 +126,26 @@ LEAFLET_HTML = """
       <path d="M12 17v1a2 2 0 0 1 -2 2h-3a2 2 0 0 0 -2 2" />
     </svg>
     `;
-    return L.divIcon({
-      html: svg,
-      className: "",
-      iconSize: [24, 36],
-      iconAnchor: [12, 36]
-    });
   }
 
-  function addPacket(callsign, lat, lon, label) {
+  // Small circle marking an earlier position on a callsign's track
+  function addTrackDot(callsign, latlng, color) {
+    const dot = L.circleMarker(latlng, {
+      radius: 2,
+      color: color,
+      weight: 1,
+      fillColor: color,
+      fillOpacity: 0.6
+    }).addTo(markerLayer);
+
+    const dots = trackDots[callsign] || (trackDots[callsign] = []);
+    dots.push(dot);
+    if (dots.length > MAX_TRACK_POINTS) markerLayer.removeLayer(dots.shift());
+  }
+
+  // balloon = false places the position straight on the track as a dot (used for
+  // positions in a batch that are superseded by a later one of the same callsign)
+  function addPacket(callsign, lat, lon, label, pan = true, balloon = true) {
     if (!callsign) callsign = "UNKNOWN";
 
     if (!(callsign in callsignColors)) {
@@ -101,24 +157,21 @@ LEAFLET_HTML = """
     // Convert previous balloon to a circle
     if (callsign in lastBalloon) {
       const old = lastBalloon[callsign];
-      L.circleMarker(old.getLatLng(), {
-        radius: 2,
-        color: color,
-        weight: 1,
-        fillColor: color,
-        fillOpacity: 0.6
-      }).addTo(markerLayer);
+      addTrackDot(callsign, old.getLatLng(), color);
       markerLayer.removeLayer(old);
+      delete lastBalloon[callsign];
     }
 
-    // New balloon marker
-    const balloon = L.marker([lat, lon], {
-      icon: balloonIcon(color)
-    })
-    .bindPopup(label)
-    .addTo(markerLayer);
-
-    lastBalloon[callsign] = balloon;
+    if (balloon) {
+      // New balloon marker
+      lastBalloon[callsign] = L.marker([lat, lon], {
+        icon: balloonIcon(color)
+      })
+      .bindPopup(label)
+      .addTo(markerLayer);
+    } else {
+      addTrackDot(callsign, [lat, lon], color);
+    }
 
     // Track line
     if (!(callsign in tracks)) {
@@ -129,9 +182,26 @@ LEAFLET_HTML = """
       }).addTo(map);
     }
 
-    tracks[callsign].addLatLng([lat, lon]);
+    const track = tracks[callsign];
+    track.addLatLng([lat, lon]);
+    const points = track.getLatLngs();
+    if (points.length > MAX_TRACK_POINTS) {
+      points.shift();
+      track.redraw();
+    }
+
+    if (pan) map.panTo([lat, lon]);
+  }
 
-    map.panTo([lat, lon]);
+  // Batched variant: packets are [callsign, lat, lon, label] arrays. Only the
+  // newest position of each callsign gets a balloon, and the map pans once.
+  function addPackets(packets) {
+    if (!packets.length) return;
+    const newest = {};
+    packets.forEach((p, i) => { newest[p[0] || "UNKNOWN"] = i; });
+    packets.forEach((p, i) => addPacket(p[0], p[1], p[2], p[3], false, newest[p[0] || "UNKNOWN"] === i));
+    const last = packets[packets.length - 1];
+    map.panTo([last[1], last[2]]);
   }
 
   function clearTracks() {
@@ -142,11 +212,14 @@ LEAFLET_HTML = """
     }
 
     for (const cs in tracks) delete tracks[cs];
+    for (const cs in trackDots) delete trackDots[cs];
     for (const cs in callsignColors) delete callsignColors[cs];
+    for (const color in iconCache) delete iconCache[color];
     for (const cs in lastBalloon) delete lastBalloon[cs];
   }
 
   window.addPacket = addPacket;
+  window.addPackets = addPackets;
   window.clearTracks = clearTracks;
 </script>
 </body>
@@ -156,6 +229,78 @@ LEAFLET_HTML = """
 
 
 
+# ===============================
+# Python -> map bridge (QWebChannel)
+# ===============================
+
+class MapBridge(QObject):
+    """Exposed to the map page as "mapBridge"; its signals call into the page's JS."""
+    packets = pyqtSignal(list)  # list of [callsign, lat, lon, label]
+    cleared = pyqtSignal()
+    page_ready = pyqtSignal()
+
+    @pyqtSlot()
+    def ready(self):
+        """Called by the page once it has connected to the signals."""
+        self.page_ready.emit()
+
+
+# ===============================
+# Packet table model
+# ===============================
+
+class PacketModel(QAbstractTableModel):
+    """
+    Read-only table of received packets; each row is a tuple of display strings.
+    Only the most recent max_rows packets are kept.
+    """
+
+    def __init__(self, fields, max_rows=5000, parent=None):
+        """
+        Args:
+            fields (list): (packet key, column header) pairs
+            max_rows (int): Oldest rows are dropped beyond this count
+        """
+        super().__init__(parent)
+        self._keys = tuple(key for key, _ in fields)
+        self._headers = tuple(label for _, label in fields)
+        self._rows = deque(maxlen=max_rows)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._keys)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self._rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self._headers[section]
+        return super().headerData(section, orientation, role)
+
+    def add_packet(self, data: dict):
+        """Append one packet as a new row, dropping the oldest row when full."""
+        get = data.get
+        if len(self._rows) == self._rows.maxlen:
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            self._rows.popleft()
+            self.endRemoveRows()
+        row = len(self._rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.append(tuple(str(get(key, "")) for key in self._keys))
+        self.endInsertRows()
+
+    def clear(self):
+        """Remove all rows."""
+        self.beginResetModel()
+        self._rows.clear()
+        self.endResetModel()
+
+
 # ===============================
 # Worker thread (Meshtastic client)
 # ===============================
@@ -178,12 +323,24 @@ class SondeWorker(QThread):
         self.sonde_received.emit(data)
 
     def run(self):
+        # Packets arrive on Meshtastic's own thread and reach the GUI through the
+        # queued sonde_received signal, so the thread only needs to connect
         if self.client.connect():
             self.status_changed.emit("Connected – listening for packets")
-            self.client.listen()
         else:
             self.status_changed.emit("Failed to connect to Meshtastic device")
 
+    def stop(self):
+        """
+        Wait for a pending connect, then disconnect the client and stop its
+        background threads. Never raises: it runs from MainWindow.closeEvent.
+        """
+        self.wait()
+        try:
+            self.client.disconnect()
+        except Exception as e:
+            print(f"Error disconnecting client: {e}")
+
 
 # ===============================
 # Main GUI window
@@ -216,13 +373,34 @@ class MainWindow(QMainWindow):
 
         self.status_label = QLabel("Disconnected")
 
-        self.table = QTableWidget(0, len(self.fields))
-        self.table.setHorizontalHeaderLabels([label for _, label in self.fields])
+        # Rows live in the model; the proxy keeps the view sorted as rows are
+        # inserted (one binary-search insert instead of a full re-sort)
+        self.model = PacketModel(self.fields, parent=self)
+        self.sort_proxy = QSortFilterProxyModel(self)
+        self.sort_proxy.setSourceModel(self.model)
+        self.table = QTableView()
+        self.table.setModel(self.sort_proxy)
         self.table.setSortingEnabled(True)
 
         # 🌍 Map
         self.map_view = QWebEngineView()
-        self.map_view.setHtml(LEAFLET_HTML)
+
+        # Packets are passed to the page as structured signal arguments
+        self.map_bridge = MapBridge(self)
+        self.map_bridge.page_ready.connect(self._on_map_ready)
+        self._map_ready = False
+        self._web_channel = QWebChannel(self)
+        self._web_channel.registerObject("mapBridge", self.map_bridge)
+        self.map_view.page().setWebChannel(self._web_channel)
+        self.load_map()
+
+        # Map updates are collected and sent as one batch; bounded so a page
+        # that never becomes ready cannot grow it without limit
+        self._pending_map = deque(maxlen=MAX_PENDING_MAP_PACKETS)
+        self._map_timer = QTimer(self)
+        self._map_timer.setSingleShot(True)
+        self._map_timer.setInterval(200)
+        self._map_timer.timeout.connect(self.flush_map_updates)
 
         self.clear_button = QPushButton("Clear tracks")
         self.clear_button.clicked.connect(self.clear_tracks)
@@ -239,29 +417,44 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(container)
 
 
+    def load_map(self):
+        """
+        Load the map page from a cached local file so Chromium's HTTP cache
+        serves the Leaflet assets on later starts (setHtml pages bypass it).
+        """
+        cache_dir = Path(QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation))
+        cache_path = cache_dir / "sonde_map.html"
+        try:
+            # Rewrite only if missing or stale
+            if not cache_path.is_file() or cache_path.read_text(encoding="utf-8") != LEAFLET_HTML:
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                cache_path.write_text(LEAFLET_HTML, encoding="utf-8")
+        except OSError as e:
+            print(f"Could not cache map page, loading inline: {e}")
+            self.map_view.setHtml(LEAFLET_HTML)
+            return
+
+        # A file:// page needs this to load the Leaflet CDN assets and tiles
+        self.map_view.settings().setAttribute(
+            QWebEngineSettings.WebAttribute.LocalContentCanAccessRemoteUrls, True
+        )
+        self.map_view.setUrl(QUrl.fromLocalFile(str(cache_path)))
+
+
     # ===============================
     # GUI update logic
     # ===============================
 
 
     def add_packet_row(self, data: dict):
-        sorting = self.table.isSortingEnabled()
-        if sorting:
-            self.table.setSortingEnabled(False)
-
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-
-        for col, (key, _) in enumerate(self.fields):
-          value = str(data.get(key, ""))
-          item = QTableWidgetItem(value)
-          item.setFlags(item.flags() ^ Qt.ItemFlag.ItemIsEditable)
-          self.table.setItem(row, col, item)
+        # Follow new rows only if the user has not scrolled up
+        scroll_bar = self.table.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
 
-        if sorting:
-            self.table.setSortingEnabled(True)
+        self.model.add_packet(data)
 
-        self.table.scrollToBottom()
+        if at_bottom:
+            self.table.scrollToBottom()
 
         # 🌍 Send to map
         lat = data.get("latitude")
@@ -275,26 +468,41 @@ class MainWindow(QMainWindow):
                 f"Time: {data.get('time', '')}"
             )
 
-            js = (
-                f"addPacket("
-                f"{json.dumps(callsign)}, "
-                f"{lat}, "
-                f"{lon}, "
-                f"{json.dumps(label)}"
-                f");"
-            )
-            self.map_view.page().runJavaScript(js)
-    
+            self._pending_map.append([callsign, lat, lon, label])
+            if not self._map_timer.isActive():
+                self._map_timer.start()
+
+    def flush_map_updates(self):
+        """Send all pending packets to the map as a single batch."""
+        if not self._pending_map or not self._map_ready:
+            return
+        packets = list(self._pending_map)
+        self._pending_map.clear()
+        self.map_bridge.packets.emit(packets)
+
+    def _on_map_ready(self):
+        """The page is listening: send anything queued while it loaded."""
+        self._map_ready = True
+        self.flush_map_updates()
+
     def clear_tracks(self):
-        # Clear map (markers + tracks)
-        self.map_view.page().runJavaScript("clearTracks();")
+        # Drop packets not yet sent to the map, then clear it (markers + tracks)
+        self._map_timer.stop()
+        self._pending_map.clear()
+        self.map_bridge.cleared.emit()
 
         # Clear table
-        self.table.setRowCount(0)
+        self.model.clear()
 
     def set_status(self, text: str):
         self.status_label.setText(text)
 
+    def closeEvent(self, event):
+        worker = getattr(self, "worker", None)
+        if worker is not None:
+            worker.stop()
+        super().closeEvent(event)
+
     # ===============================
     # Start background worker
     # ===============================
@@ -1,9 +1,6 @@
-from DataOptimizer import DataOptimizer
+from DataOptimizer import optimizer
 from rich.console import Console
 
-# Create optimizer instance
-optimizer = DataOptimizer()
-
 print("=== Optimizer Tester ===")
 print("Enter a hex string (CBOR2 encoded data) to decode back to JSON")
 print("Or enter 'quit' to exit\n")